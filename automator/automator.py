@@ -2,7 +2,10 @@ import redis
 import time
 
 from interface import Interface
+from journal import Journal, JOURNAL_PATH, VLASS, REC, PROC, NODE_REC, NODE_PROC
 from logger import log
+from profiler import profiler, PROFILE_CHAN
+from segments import SegmentPlanner, node_transitions
 from utils import Utils
 
 from astropy.coordinates import SkyCoord
@@ -18,12 +21,16 @@ class Automator(object):
 
     """ 
 
-    def __init__(self, redis_endpoint, redis_channel):
+    def __init__(self, redis_endpoint, redis_channel,
+        journal_path=JOURNAL_PATH, track_length=None):
         """Construct an Automator.
 
         Args:
             redis_endpoint (str): Redis endpoint (of the form
             <host IP address>:<port>)
+            journal_path (str): File path of the binary event journal.
+            track_length (float): Nominal VLASS track length in seconds,
+            if known, for planning segments.
         """ 
         redis_host, redis_port = redis_endpoint.split(':')
         # Redis connection:
@@ -43,6 +50,13 @@ class Automator(object):
         self.vlass_state = 'unknown'
         self.rec_state = 'unknown'
         self.proc_state = 'unknown'
+        # Event journal for post-mortems:
+        self.journal = Journal(journal_path)
+        # Last known status of each node, per status hash:
+        self.node_states = {NODE_PROC: {}, NODE_REC: {}}
+        # Segment duration planning:
+        self.segments = SegmentPlanner()
+        self.track_length = track_length
 
     def start(self):
         """Start the automator. Actions to be taken depend on the incoming 
@@ -67,42 +81,60 @@ class Automator(object):
             self.vlass_state_change(True)
 
         # Listen for updates as observing progresses
+        # (and for profiling control changes):
+        profiler.install_signals()
+        self.ps.subscribe(PROFILE_CHAN)
         self.u.alert('Listening for VLASS, processing and recording updates.')
         for msg in self.ps.listen():
+            if msg['channel'] == PROFILE_CHAN:
+                profiler.update(self.r)
+            else:
+                self.dispatch(msg)
 
-            # Awaiting an active VLASS track:
-            if msg['data'] == 'vlass-track':
-                if new_telescope_state != self.telescope_state:
-                    self.vlass_state = new_telescope_state
-                    self.vlass_state_change(new_telescope_state)
+    @profiler.hook
+    def dispatch(self, msg):
+        """Act on a single observational stage message.
+        """
+        # Awaiting an active VLASS track:
+        if msg['data'] == 'vlass-track':
+            if new_telescope_state != self.telescope_state:
+                self.vlass_state = new_telescope_state
+                self.vlass_state_change(new_telescope_state)
 
-            # Check for recording updates:
-            if msg['data'] == 'rec_update':
-                self.rec_update()
+        # Check for recording updates:
+        if msg['data'] == 'rec_update':
+            self.rec_update()
 
-            # Check for processing updates:
-            if msg['data'] == 'proc_update':
-                self.proc_update()
+        # Check for processing updates:
+        if msg['data'] == 'proc_update':
+            self.proc_update()
 
     def proc_state_change(self, new_state):
         """Actions to take if the processing state changes
         """
         if not new_state and self.proc_state:
             # Processing is finished. 
+            self.journal.transition(PROC, self.proc_state, False)
             self.proc_state = False 
             # Check if we should record a new vlass segment:
             if self.vlass_state:
+                self.journal.decision('record_track')
                 self.record_track()     
             else:
+                self.journal.decision('track_ended')
                 self.u.alert('Processing complete, but VLASS is no longer tracking.')
                 self.u.alert('Waiting for a new VLASS track.')
         elif new_state and not self.proc_state:
-            self.proc_status = True
+            self.journal.transition(PROC, self.proc_state, True)
+            self.proc_state = True
 
     def proc_update(self):
         """Checks current processing state. 
         """
         status_lists, total = self.u.pooled_status(self.r, 'Automator:proc_status')
+        transitions = node_transitions(self.node_states[NODE_PROC], status_lists)
+        self.journal_nodes(NODE_PROC, transitions)
+        self.segments.update(transitions, time.time())
         # For now, wait for ALL nodes to complete
         if 'idling' not in status_lists:
             # Need this temporarily since all states not known yet
@@ -122,6 +154,8 @@ class Automator(object):
         """Checks current recording state.
         """
         status_lists, total = self.u.pooled_status(self.r, 'Automator:rec_status')
+        transitions = node_transitions(self.node_states[NODE_REC], status_lists)
+        self.journal_nodes(NODE_REC, transitions)
         # For now, wait for ALL nodes to complete
         if len(status_lists['idling']) == total and self.rec_state:
             self.u.alert('No current recording.')
@@ -134,8 +168,16 @@ class Automator(object):
     def rec_state_change(self, new_state):
         """Actions to take if the recording state changes:
         """ 
+        if new_state != self.rec_state:
+            self.journal.transition(REC, self.rec_state, new_state)
         self.rec_state = new_state 
 
+    def journal_nodes(self, kind, transitions):
+        """Journal changes in individual node statuses.
+        """
+        for instance, old, new in transitions:
+            self.journal.node(kind, instance, old, new)
+
     def vlass_state_change(self, new_state):
         """Actions to take if the state of the telescope changes.
         """
@@ -144,18 +186,25 @@ class Automator(object):
         # immediately:
         if not new_state and self.vlass_state:
             # Stop recording
+            self.journal.decision('stop_recording')
             self.interface.stop_all()
+            self.journal.stop_cmd()
+            self.journal.transition(VLASS, self.vlass_state, new_state)
             self.vlass_state = new_state
         
         # If we are already recording or processing, do not record a new track
         elif self.rec_state:
+            self.journal.decision('already_recording')
             self.u.alert('Already recording segment for current track.')
         elif self.proc_state:
+            self.journal.decision('awaiting_processing')
             self.u.alert('Waiting for processing of previous segment to finish.')
         
         # If we are not recording or processing, and vlass has started tracking:
         elif new_state:    
+            self.journal.transition(VLASS, self.vlass_state, new_state)
             self.vlass_state = new_state
+            self.journal.decision('record_track')
             self.record_track()     
 
     def record_track(self):
@@ -164,10 +213,17 @@ class Automator(object):
         # Retrieve metadata:
         ra, dec, fcent, ra_rate, ts = self.interface.vlass_metadata()
         log.info(self.interface.vlass_metadata())
+        # Choose segment duration from current processing throughput
+        # (this sets the phase center, so must come first):
+        remaining = None
+        if self.track_length is not None:
+            elapsed = (self.mjd_now() - float(ts))*86400.0
+            remaining = self.track_length - elapsed
+        duration, spacing = self.segments.plan(remaining, fcent)
         # Calculate phase center:
         # Using VLASS standard slew rate of 3.3 arcmin/sec (0.055 deg/sec) 
         # until ra_rate units are understood
-        ra_c, dec_c = self.select_phase_center(0.055, ts, ra, dec)
+        ra_c, dec_c = self.select_phase_center(0.055, ts, ra, dec, duration)
         self.r.set('phase_center_ra', f'{ra_c}')
         self.r.set('phase_center_dec', f'{dec_c}')
         # Request new targets around phase center
@@ -180,8 +236,11 @@ class Automator(object):
             fcent
             )
         # Instruct recording to start
-        self.interface.record_minimal(time.time() + 1, 10, 'COSMIC_TEST_a')
-        self.u.alert('Recording a new VLASS track.')
+        self.interface.record_minimal(time.time() + 1, duration, 'COSMIC_TEST_a')
+        self.segments.segment_recorded(duration)
+        self.journal.record_cmd(duration, 'COSMIC_TEST_a')
+        self.u.alert('Recording a new VLASS track segment: {:.1f} s '
+            '(next expected in {:.1f} s).'.format(duration, spacing))
 
     def offset_ra(self, angle, ra, dec):
         """Return new RA given a separation.
@@ -193,13 +252,15 @@ class Automator(object):
     def mjd_now(self):
         return time.time()/86400.0 + 40587.0
 
-    def select_phase_center(self, slew_rate, t_start, ra, dec):
-        """Select coordinates based on slew_rate, coordinates and time.
+    def select_phase_center(self, slew_rate, t_start, ra, dec, duration):
+        """Select coordinates based on slew_rate, coordinates and time,
+        at the middle of a segment of the given duration (seconds).
         """
-        # Separation since packet received (5 seconds to phase center)
-        # Add another buffer of 1 second (will specify tstart 1 sec in 
-        # the future)
-        ra_sep_start = (self.mjd_now() - float(t_start) + 6)*float(slew_rate)
+        # Separation since packet received (half the segment duration to
+        # phase center). Add another buffer of 1 second (will specify 
+        # tstart 1 sec in the future)
+        lead = duration/2 + 1
+        ra_sep_start = (self.mjd_now() - float(t_start) + lead)*float(slew_rate)
         ra, dec = self.offset_ra(ra_sep_start, ra, dec)
         return ra, dec
 
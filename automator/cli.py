@@ -2,6 +2,7 @@ import argparse
 import sys
 
 from automator import Automator
+from journal import JOURNAL_PATH
 from logger import log, set_logger
 
 def cli(args = sys.argv[0]):
@@ -20,22 +21,35 @@ def cli(args = sys.argv[0]):
                         type = str,
                         default = 'META_flagAnt', 
                         help = 'Antenna flag key.')
+    parser.add_argument('--journal', 
+                        type = str,
+                        default = JOURNAL_PATH, 
+                        help = 'Binary event journal file.')
+    parser.add_argument('--track_length', 
+                        type = float,
+                        default = None, 
+                        help = 'Nominal VLASS track length (s) for segment planning.')
     if(len(sys.argv[1:]) == 0):
         parser.print_help()
         parser.exit()
     args = parser.parse_args()
     main(redis_endpoint = args.redis_endpoint, 
          antenna_key = args.antenna_key,
+         journal_path = args.journal,
+         track_length = args.track_length,
          )
 
     
-def main(redis_endpoint, antenna_key):
+def main(redis_endpoint, antenna_key, journal_path=JOURNAL_PATH,
+    track_length=None):
     """Starts the automator process.
     
     Args:
         redis_endpoint (str): Redis endpoint (of the form 
         <host IP address>:<port>)
         redis_chan (str): Name of Redis channel. 
+        journal_path (str): Binary event journal file. 
+        track_length (float): Nominal VLASS track length in seconds. 
         
     Returns:
         None    
@@ -43,7 +57,9 @@ def main(redis_endpoint, antenna_key):
     set_logger('DEBUG')
     Automation = Automator(
         redis_endpoint,
-        antenna_key
+        antenna_key,
+        journal_path,
+        track_length
     )
     Automation.start()
 
@@ -4,6 +4,7 @@ import inspect
 import json
 
 from logger import log
+from profiler import profiler
 from utils import Utils 
 
 from cosmic.observations.record import record as cosmic_record, hashpipe_recordStop
@@ -34,6 +35,7 @@ class Interface(object):
         self.u = Utils()
 
 
+    @profiler.hook
     def _execute_with_response_in_key(self,
         func,
         redis_key,
@@ -79,6 +81,7 @@ class Interface(object):
         return self.r.get(redis_key)
 
 
+    @profiler.hook
     def internal_conditions(self):
         """Check if there are any underlying telescope-specific observing 
         conditions set via internal configuration.
@@ -98,6 +101,7 @@ class Interface(object):
 
         return int(response) > 0
 
+    @profiler.hook
     def conditionally_observe(self, instances, output_dir):
         """Observe (recording, processing and cleanup) respecting underlying
         telescope-specific low-level observing conditions.
@@ -119,6 +123,7 @@ class Interface(object):
         )
         return response.split(';')
 
+    @profiler.hook
     def record(self, instances, duration, rec_dir, rec_type):
         """Instruct instances to record as above, ignoring most 
         conditions.  
@@ -150,6 +155,7 @@ class Interface(object):
         )
         return instances
 
+    @profiler.hook
     def stop_recording(self, instances):
         """Stop any in-progress recording.
 
@@ -168,6 +174,7 @@ class Interface(object):
         )
         return instances
 
+    @profiler.hook
     def is_vlass_obs(self):
         """Check if current observation is a VLASS observation. 
         """
@@ -179,6 +186,7 @@ class Interface(object):
         else:
             return False
 
+    @profiler.hook
     def is_vlass_cal(self):
         """Check if current observation is a VLASS calibration observation of
         a fixed RA/Dec.
@@ -190,6 +198,7 @@ class Interface(object):
         else:
             return False
 
+    @profiler.hook
     def is_vlass_track(self):
         """Check if current observation is a VLASS track.
         """
@@ -201,6 +210,7 @@ class Interface(object):
         else:
             return False
 
+    @profiler.hook
     def vlass_metadata(self):
         """Retrieve VLASS metadata for vlass track observations.
         """
@@ -214,6 +224,7 @@ class Interface(object):
         ts = intents['AntennaRatet0']
         return ra, dec, fcent, ra_rate, ts
 
+    @profiler.hook
     def request_targets(self, new_targets_chan, ts, src, ra_deg, dec_deg, fecenter):
         """Request new targets from the target selector.  
         NOTE: Will be replaced with updated targets-minimal process. 
@@ -231,6 +242,7 @@ class Interface(object):
         )
         self.r.publish(new_targets_chan, msg)
 
+    @profiler.hook
     def record_minimal(self, tstart, duration_sec, projid):
         """Minimal initiation of recording. 
         """
@@ -242,11 +254,13 @@ class Interface(object):
         }
         self.r.set('observationRecord', json.dumps(rec_dict))
     
+    @profiler.hook
     def stop_all(self):
         """Wrapper to stop all recording across all nodes. 
         """
         hashpipe_recordStop(redis_obj=self.r)
 
+    @profiler.hook
     def expected_antennas(self, meta_hash='META', antenna_key='station'):
         """Retrieve the list of antennas that are expected to be used 
         for the current observation.
@@ -258,6 +272,7 @@ class Interface(object):
         else:
             return []
 
+    @profiler.hook
     def on_source_antennas(self, ant_hash='META_flagAnt', on_key='on_source'):
         """Retrieve the list of on-source antennas.
         """
@@ -267,6 +282,7 @@ class Interface(object):
         else:
             return []
 
+    @profiler.hook
     def telescope_state(self, stragglers=2, antenna_hash='META_flagAnt', 
         on_key='on_source'):
         """Retrieve the current state of the telescope. This must be 
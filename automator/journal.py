@@ -0,0 +1,330 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from logger import log
+
+JOURNAL_PATH = '/tmp/automator.journal'
+DEFAULT_CAPACITY = 65536
+MAGIC = b'AUTJRNL2'
+# Longest name (e.g. host/instance) stored in full; longer names are
+# truncated and flagged:
+NAME_LEN = 32
+
+# Header: magic, record size, capacity, total records ever written.
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+COUNT_OFFSET = 16
+COUNT = struct.Struct('<Q')
+
+# Record: monotonic ns, wall time, kind, old code, new code, flags, name,
+# value.
+RECORD = struct.Struct('<QdBBBB4x{}sd'.format(NAME_LEN))
+RECORD_SIZE = RECORD.size
+RECORD_DTYPE = np.dtype({
+    'names': ['mono_ns', 'wall', 'kind', 'old', 'new', 'flags', 'name',
+        'value'],
+    'formats': ['<u8', '<f8', 'u1', 'u1', 'u1', 'u1', 'S{}'.format(NAME_LEN),
+        '<f8'],
+    'offsets': [0, 8, 16, 17, 18, 19, 24, 24 + NAME_LEN],
+    'itemsize': RECORD_SIZE
+})
+
+# Record flags:
+NAME_TRUNCATED = 1
+
+# Record kinds:
+VLASS = 1
+REC = 2
+PROC = 3
+DECISION = 4
+RECORD_CMD = 5
+STOP_CMD = 6
+NODE_REC = 7
+NODE_PROC = 8
+KINDS = {
+    VLASS: 'vlass',
+    REC: 'rec',
+    PROC: 'proc',
+    DECISION: 'decision',
+    RECORD_CMD: 'record',
+    STOP_CMD: 'stop',
+    NODE_REC: 'node_rec',
+    NODE_PROC: 'node_proc'
+}
+
+# Codes for the old/new fields, by kind:
+STATES = ['unknown', False, True]
+# (`other` marks a status not listed here; see `Journal.node`.)
+NODE_STATUSES = ['unknown', 'idling', 'recording', 'processing', 'error',
+    'armed', 'pending', 'idle', 'other']
+NODE_OTHER = NODE_STATUSES.index('other')
+DECISIONS = ['none', 'record_track', 'stop_recording', 'already_recording',
+    'awaiting_processing', 'track_ended']
+
+def _code(values, value):
+    """Index of value in the list of codes, or 0 if unknown.
+    """
+    for i, v in enumerate(values):
+        if v is value or (type(v) == type(value) and v == value):
+            return i
+    return 0
+
+class Journal(object):
+    """Fixed-size, memory-mapped ring buffer of binary event records.
+
+    Records are written straight into a shared file mapping, so every
+    record written before a crash is retained in the file. Once
+    `capacity` records have been written, the oldest are overwritten.
+    See `read` for retrieving records.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, capacity=DEFAULT_CAPACITY):
+        """Open (or create) a journal.
+
+        Args:
+            path (str): Journal file path. An existing journal with the
+            same layout is appended to; any other existing file is moved
+            aside to `<path>.<unix time>.old` rather than overwritten.
+            capacity (int): Number of records held before wrapping.
+        """
+        size = HEADER_SIZE + capacity*RECORD_SIZE
+        self.capacity = capacity
+        self.count = None
+        self.unrecognised = set()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if os.path.getsize(path) == size:
+                with open(path, 'rb') as f:
+                    magic, rec_size, cap, count = HEADER.unpack(
+                        f.read(HEADER.size))
+                if (magic, rec_size, cap) == (MAGIC, RECORD_SIZE, capacity):
+                    self.count = count
+            if self.count is None:
+                aside = '{}.{}.old'.format(path, int(time.time()))
+                n = 1
+                while os.path.exists(aside):
+                    aside = '{}.{}-{}.old'.format(path, int(time.time()), n)
+                    n += 1
+                os.rename(path, aside)
+                log.warning('{} is not a journal with this layout and '
+                    'capacity; moved it to {}'.format(path, aside))
+        self.f = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+b')
+        if self.count is None:
+            log.info('Initialising journal: {}'.format(path))
+            self.count = 0
+            self.f.truncate(size)
+        self.mm = mmap.mmap(self.f.fileno(), size)
+        HEADER.pack_into(self.mm, 0, MAGIC, RECORD_SIZE, capacity, self.count)
+
+    def write(self, kind, old=0, new=0, name='', value=0.0):
+        """Append a single record. Names longer than `NAME_LEN` bytes
+        are truncated, and the record flagged with `NAME_TRUNCATED`.
+        """
+        name = name.encode()
+        offset = HEADER_SIZE + (self.count % self.capacity)*RECORD_SIZE
+        RECORD.pack_into(
+            self.mm,
+            offset,
+            time.monotonic_ns(),
+            time.time(),
+            kind,
+            old,
+            new,
+            NAME_TRUNCATED if len(name) > NAME_LEN else 0,
+            name,
+            value
+        )
+        # Publish the record only once it is complete:
+        self.count += 1
+        COUNT.pack_into(self.mm, COUNT_OFFSET, self.count)
+
+    def transition(self, kind, old, new):
+        """Record a vlass/rec/proc state transition.
+        """
+        self.write(kind, _code(STATES, old), _code(STATES, new))
+
+    def decision(self, decision):
+        """Record a decision taken by the automator.
+        """
+        self.write(DECISION, new=_code(DECISIONS, decision))
+
+    def record_cmd(self, duration, projid):
+        """Record a commanded recording.
+        """
+        self.write(RECORD_CMD, name=projid, value=duration)
+
+    def stop_cmd(self):
+        """Record a commanded stop.
+        """
+        self.write(STOP_CMD)
+
+    def node(self, kind, instance, old, new):
+        """Record a change in the status of a single node instance.
+        Statuses not in `NODE_STATUSES` are recorded as `other`.
+        """
+        self.write(
+            kind,
+            self._node_code(old),
+            self._node_code(new),
+            instance
+        )
+
+    def _node_code(self, status):
+        """Code for a node status, warning (once per status) if it is
+        not recognised.
+        """
+        if status is None:
+            return 0
+        code = _code(NODE_STATUSES, status)
+        if code == 0 and status != 'unknown':
+            if status not in self.unrecognised:
+                self.unrecognised.add(status)
+                log.warning('Unrecognised node status for journal: '
+                    '{}'.format(status))
+            return NODE_OTHER
+        return code
+
+    def close(self):
+        """Flush and close the journal.
+        """
+        self.mm.flush()
+        self.mm.close()
+        self.f.close()
+
+def read(path=JOURNAL_PATH, start=None, stop=None):
+    """Read journal records, oldest first.
+
+    Args:
+        path (str): Journal file path.
+        start (float): Earliest wall time (Unix seconds) to include.
+        stop (float): Latest wall time (Unix seconds) to include.
+
+    Returns:
+        Structured NumPy array with dtype `RECORD_DTYPE`.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, rec_size, capacity, count = HEADER.unpack_from(data)
+    if magic != MAGIC or rec_size != RECORD_SIZE:
+        raise ValueError('Not a journal file: {}'.format(path))
+    records = np.frombuffer(
+        data,
+        dtype=RECORD_DTYPE,
+        count=capacity,
+        offset=HEADER_SIZE
+    )
+    if count <= capacity:
+        records = records[:count]
+    else:
+        records = np.roll(records, -(count % capacity))
+    mask = np.ones(len(records), dtype=bool)
+    if start is not None:
+        mask &= records['wall'] >= start
+    if stop is not None:
+        mask &= records['wall'] <= stop
+    return records[mask]
+
+def to_dict(record):
+    """Convert a single record to a JSON-serialisable dict.
+    """
+    kind = int(record['kind'])
+    if kind in [VLASS, REC, PROC]:
+        codes = STATES
+    elif kind in [NODE_REC, NODE_PROC]:
+        codes = NODE_STATUSES
+    elif kind == DECISION:
+        codes = DECISIONS
+    else:
+        codes = None
+    entry = {
+        'wall': float(record['wall']),
+        'mono_ns': int(record['mono_ns']),
+        'kind': KINDS.get(kind, kind)
+    }
+    if codes is not None:
+        if kind != DECISION:
+            entry['old'] = codes[record['old']]
+        entry['new'] = codes[record['new']]
+    name = record['name'].decode(errors='replace')
+    if name:
+        entry['name'] = name
+    if record['flags'] & NAME_TRUNCATED:
+        entry['name_truncated'] = True
+    if kind == RECORD_CMD:
+        entry['duration'] = float(record['value'])
+    return entry
+
+def _timestamp(value):
+    """Parse Unix seconds or an ISO timestamp (UTC if no zone given).
+    """
+    try:
+        return float(value)
+    except ValueError:
+        ts = datetime.fromisoformat(value)
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.timestamp()
+
+def cli():
+    """CLI for exporting a window of the journal.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Export automator journal records.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--journal",
+        type=str,
+        default=JOURNAL_PATH,
+        help="The journal file.",
+    )
+    parser.add_argument(
+        "--start",
+        type=_timestamp,
+        default=None,
+        help="Start of window (Unix seconds or ISO timestamp, UTC).",
+    )
+    parser.add_argument(
+        "--stop",
+        type=_timestamp,
+        default=None,
+        help="End of window (Unix seconds or ISO timestamp, UTC).",
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["ndjson", "npy"],
+        default="ndjson",
+        help="Output format.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Output file (required for npy; ndjson defaults to stdout).",
+    )
+    args = parser.parse_args()
+
+    records = read(args.journal, args.start, args.stop)
+    if args.format == 'npy':
+        if args.output is None:
+            parser.error('--output is required for npy format')
+        np.save(args.output, records)
+        return
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    for record in records:
+        out.write(json.dumps(to_dict(record)) + '\n')
+    if out is not sys.stdout:
+        out.close()
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,304 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from logger import log
+
+# VLASS standard slew rate (on-sky degrees per second):
+SLEW_RATE = 0.055
+# Primary beam FWHM of a VLA antenna at 1 GHz, in degrees:
+PB_FWHM_1GHZ = 0.75
+RECIPE_DIR = '/tmp/automator_recipes'
+
+def fov_radius(fcent):
+    """Primary field of view radius (half FWHM) in degrees.
+
+    Args:
+        fcent (float): Centre frequency in Hz.
+    """
+    return 0.5*PB_FWHM_1GHZ/(fcent/1e9)
+
+def plan_segments(ra, dec, t_ref, starts, durations, slew_rate=SLEW_RATE):
+    """Starting pointings for segments along a constant-declination scan.
+
+    Args:
+        ra (float): RA of the pointing at `t_ref` (degrees).
+        dec (float): Declination of the scan (degrees).
+        t_ref (float): Reference time for `ra` (Unix seconds).
+        starts (array): Start time of each segment (Unix seconds).
+        durations (array): Duration of each segment (seconds), e.g. as
+        chosen by `SegmentPlanner`; a scalar applies to all segments.
+        slew_rate (float): On-sky scan rate (degrees per second).
+
+    Returns:
+        Dict of per-segment arrays: `start`, `duration`, `ra`, `dec`.
+    """
+    starts = np.asarray(starts, dtype=float)
+    durations = np.broadcast_to(np.asarray(durations, dtype=float),
+        starts.shape).copy()
+    ra_start = (ra + slew_rate*(starts - t_ref)/np.cos(np.radians(dec))) % 360
+    return {
+        'start': starts,
+        'duration': durations,
+        'ra': ra_start,
+        'dec': np.full(starts.shape, float(dec))
+    }
+
+def _ranges(lo, hi):
+    """Concatenated aranges [lo[i], hi[i]) and the index i of each entry.
+    """
+    counts = np.maximum(hi - lo, 0)
+    which = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+        counts)
+    return which, lo[which] + offsets
+
+def transit_windows(target_ra, target_dec, segments, radius,
+    slew_rate=SLEW_RATE):
+    """Compute when each target lies within the primary field of view
+    during each segment.
+
+    The pointing moves at constant declination, so a target at
+    declination d is within `radius` of it while the RA offset is within
+    +/-w, where cos(w) = (cos r - sin d sin D)/(cos d cos D) (exact on
+    the sphere). Targets are sorted by RA and only those within each
+    segment's RA span (found with `np.searchsorted`) are evaluated.
+
+    A segment may sweep at most 180 degrees of RA (this limits scans to
+    within about 0.25 degrees of the poles); a `ValueError` is raised
+    otherwise.
+
+    Args:
+        target_ra (array): Target RAs (degrees), shape (N,).
+        target_dec (array): Target declinations (degrees), shape (N,).
+        segments (dict): Per-segment arrays of shape (M,), as returned by
+        `plan_segments`.
+        radius (float): Field of view radius (degrees).
+        slew_rate (float): On-sky scan rate in RA (degrees per second).
+
+    Returns:
+        Per visible (target, segment) pair, ordered by segment:
+        target (array): Target index.
+        segment (array): Segment index.
+        t_enter (array): Entry time offset from segment start (seconds).
+        t_exit (array): Exit time offset from segment start (seconds).
+    """
+    target_ra = np.asarray(target_ra, dtype=float) % 360
+    target_dec = np.asarray(target_dec, dtype=float)
+    seg_ra = segments['ra']
+    seg_dec = np.radians(segments['dec'])
+    duration = segments['duration']
+    # RA rate of the pointing (degrees per second):
+    with np.errstate(divide='ignore'):
+        ra_rate = slew_rate/np.cos(seg_dec)
+    if np.any(~np.isfinite(ra_rate) | (np.abs(ra_rate)*duration > 180)):
+        raise ValueError('Segments may sweep at most 180 degrees of RA '
+            '(declination too close to a pole).')
+    r = np.radians(radius)
+    # Candidate targets: RA within each segment's sweep, padded by the
+    # RA half-width of the field of view:
+    sin_pad = np.sin(r)/np.cos(seg_dec)
+    pad = np.where(sin_pad < 1,
+        np.degrees(np.arcsin(np.clip(sin_pad, 0, 1))), 180.0)
+    sweep_lo = seg_ra + np.minimum(0, ra_rate*duration)
+    width = np.abs(ra_rate)*duration + 2*pad
+    lo = (sweep_lo - pad) % 360
+    hi = np.minimum(lo + width, lo + 360)
+    order = np.argsort(target_ra)
+    ra_sorted = target_ra[order]
+    i_lo = np.searchsorted(ra_sorted, lo)
+    i_hi = np.searchsorted(ra_sorted, np.minimum(hi, 360), side='right')
+    # Spans wrapping through RA 0:
+    i_wrap = np.searchsorted(ra_sorted, np.clip(hi - 360, 0, None),
+        side='right')
+    i_wrap = np.where(hi > 360, np.minimum(i_wrap, i_lo), 0)
+    seg_a, pos_a = _ranges(i_lo, i_hi)
+    seg_b, pos_b = _ranges(np.zeros_like(i_wrap), i_wrap)
+    segment = np.concatenate((seg_a, seg_b))
+    target = order[np.concatenate((pos_a, pos_b))]
+    by_segment = np.argsort(segment, kind='stable')
+    segment = segment[by_segment]
+    target = target[by_segment]
+    # Exact RA half-width w of the field of view at each target's dec:
+    d = np.radians(target_dec[target])
+    dec_p = seg_dec[segment]
+    cos_w = (np.cos(r) - np.sin(d)*np.sin(dec_p))/(np.cos(d)*np.cos(dec_p))
+    w = np.degrees(np.arccos(np.clip(cos_w, -1, 1)))
+    rate = ra_rate[segment]
+    dur = duration[segment]
+    # RA offset from the mid-segment pointing, and time of closest
+    # approach:
+    ra_mid = seg_ra[segment] + rate*dur/2
+    d_ra = (target_ra[target] - ra_mid + 180) % 360 - 180
+    t_mid = dur/2 + d_ra/rate
+    half = w/np.abs(rate)
+    t_enter = np.clip(t_mid - half, 0, dur)
+    t_exit = np.clip(t_mid + half, 0, dur)
+    visible = (cos_w < 1) & (t_exit > t_enter)
+    return (target[visible], segment[visible], t_enter[visible],
+        t_exit[visible])
+
+def build_recipes(target_ids, target_ra, target_dec, segments, radius,
+    slew_rate=SLEW_RATE):
+    """Build a beamformer recipe for each segment.
+
+    Each recipe lists, for every target crossing the field of view
+    during the segment, its beamforming window (Unix seconds) and the
+    pointing RA at the start and stop of that window (the pointing
+    declination is the segment's).
+
+    Returns:
+        List of recipe dicts, one per segment (columnar per target).
+    """
+    target_ids = np.asarray(target_ids)
+    target_ra = np.asarray(target_ra, dtype=float)
+    target_dec = np.asarray(target_dec, dtype=float)
+    target, segment, t_enter, t_exit = transit_windows(
+        target_ra,
+        target_dec,
+        segments,
+        radius,
+        slew_rate
+    )
+    ra_rate = slew_rate/np.cos(np.radians(segments['dec']))
+    n_segments = len(segments['start'])
+    bounds = np.searchsorted(segment, np.arange(n_segments + 1))
+    recipe_list = []
+    for j in range(n_segments):
+        sel = slice(bounds[j], bounds[j + 1])
+        idx = target[sel]
+        enter = t_enter[sel]
+        exit_ = t_exit[sel]
+        start = segments['start'][j]
+        recipe_list.append({
+            'segment': {
+                'start': float(start),
+                'duration': float(segments['duration'][j]),
+                'ra': float(segments['ra'][j]),
+                'dec': float(segments['dec'][j]),
+                'slew_rate': slew_rate
+            },
+            'targets': {
+                'id': target_ids[idx].tolist(),
+                'ra': target_ra[idx].tolist(),
+                'dec': target_dec[idx].tolist(),
+                'start': (start + enter).tolist(),
+                'stop': (start + exit_).tolist(),
+                'ra_start': ((segments['ra'][j] + ra_rate[j]*enter)
+                    % 360).tolist(),
+                'ra_stop': ((segments['ra'][j] + ra_rate[j]*exit_)
+                    % 360).tolist()
+            }
+        })
+    return recipe_list
+
+def write_recipes(recipe_list, output_dir=RECIPE_DIR, prefix='recipe'):
+    """Write one JSON recipe file per segment.
+
+    Returns:
+        List of file paths written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for j, recipe in enumerate(recipe_list):
+        path = os.path.join(output_dir, '{}_{:04d}.json'.format(prefix, j))
+        with open(path, 'w') as f:
+            f.write(json.dumps(recipe))
+        paths.append(path)
+    log.info('Wrote {} recipe files to {}'.format(len(paths), output_dir))
+    return paths
+
+def benchmark(n_targets=5000, n_segments=500, output_dir=None, seed=0):
+    """Time the full recipe stage (window computation, recipe building
+    and writing one file per segment) for random targets along a
+    simulated scan.
+
+    Args:
+        output_dir (str): Where to write recipe files. A temporary
+        directory is used (and removed) if not given.
+
+    Returns:
+        t_windows (float): Seconds for the vectorised window computation
+        alone.
+        t_build (float): Seconds to build all recipes (including the
+        window computation).
+        t_write (float): Seconds to write the recipe files.
+    """
+    rng = np.random.default_rng(seed)
+    dec = 30.0
+    spacing = 40.0
+    # Variable durations, as from SegmentPlanner:
+    durations = rng.uniform(5, 9, n_segments)
+    segments = plan_segments(0.0, dec, 0.0, np.arange(n_segments)*spacing,
+        durations)
+    radius = fov_radius(3e9)
+    # Targets scattered across the scanned strip:
+    span = SLEW_RATE*spacing*n_segments/np.cos(np.radians(dec))
+    target_ra = rng.uniform(0, span, n_targets) % 360
+    target_dec = dec + rng.uniform(-radius, radius, n_targets)
+    t0 = time.perf_counter()
+    transit_windows(target_ra, target_dec, segments, radius)
+    t1 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        t2 = time.perf_counter()
+        recipe_list = build_recipes(np.arange(n_targets), target_ra,
+            target_dec, segments, radius)
+        t3 = time.perf_counter()
+        write_recipes(recipe_list, output_dir or tmp_dir)
+        t4 = time.perf_counter()
+    return t1 - t0, t3 - t2, t4 - t3
+
+def cli():
+    """CLI for benchmarking recipe generation.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark per-segment beamformer recipe generation.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--targets",
+        type=int,
+        default=5000,
+        help="Number of targets.",
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=500,
+        help="Number of segments.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Write recipe files here (default: a temporary directory).",
+    )
+    parser.add_argument(
+        "--max_seconds",
+        type=float,
+        default=0.5,
+        help="Fail if building and writing recipes takes longer than this.",
+    )
+    args = parser.parse_args()
+    t_windows, t_build, t_write = benchmark(
+        args.targets,
+        args.segments,
+        args.output_dir
+    )
+    total = t_build + t_write
+    print('Transit windows: {:.3f} s'.format(t_windows))
+    print('Build recipes:   {:.3f} s'.format(t_build))
+    print('Write files:     {:.3f} s'.format(t_write))
+    print('Total stage:     {:.3f} s'.format(total))
+    if total > args.max_seconds:
+        print('FAIL: exceeds {:.3f} s'.format(args.max_seconds))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,366 @@
+import json
+import math
+import random
+
+from collections import deque
+
+import redis
+
+from logger import log
+from recipes import SLEW_RATE, fov_radius
+
+# VLASS band edge and centre frequencies (Hz):
+VLASS_FMIN = 2e9
+VLASS_FCENT = 3e9
+SEGMENT_DEFAULT = 10
+SEGMENT_MIN = 5
+# A segment is only useful up to a sweep of two primary beamwidths about
+# its phase centre (see docs/vlass-automation.md); cap at that sweep for
+# the widest beam in the band (~13.6 s). `plan` caps further for the
+# actual centre frequency.
+SEGMENT_MAX = 4*fov_radius(VLASS_FMIN)/SLEW_RATE
+SEGMENT_STEP = 1
+# Fixed per-segment overhead in seconds (recording start delay and
+# dispatch latency):
+SEGMENT_OVERHEAD = 2
+HISTORY_LEN = 20
+SIM_HASH = 'Automator:sim_proc_status'
+
+def node_transitions(node_states, status_lists):
+    """Find changes in individual node statuses, updating the record of
+    last known statuses in place.
+
+    Args:
+        node_states (dict): Last known status, keyed by instance.
+        status_lists (dict): Lists of instances, keyed by status (as
+        returned by `Utils.pooled_status`).
+
+    Returns:
+        List of (instance, old status, new status).
+    """
+    transitions = []
+    for status, instances in status_lists.items():
+        for instance in instances:
+            old = node_states.get(instance)
+            if old != status:
+                node_states[instance] = status
+                transitions.append((instance, old, status))
+    return transitions
+
+def usable_footprint(sweep, radius, n_steps=64):
+    """Sky area (square degrees) around a phase centre within which
+    targets are recorded for a full transit of the primary beam, for a
+    segment sweeping `sweep` degrees centred on the phase centre.
+
+    Targets are selected within `radius` of the phase centre. A target
+    at offset (x, y) transits fully if |x| <= sweep/2 - h(y), where h(y)
+    is the half-chord of the beam at y. The footprint reaches the whole
+    target circle at a sweep of two beamwidths (4*radius).
+    """
+    area = 0.0
+    dy = 2*radius/n_steps
+    for i in range(n_steps):
+        y = -radius + (i + 0.5)*dy
+        h = math.sqrt(radius**2 - y**2)
+        area += 2*max(0.0, min(h, sweep/2 - h))*dy
+    return area
+
+class SegmentPlanner(object):
+    """Chooses VLASS segment durations from a model of processing
+    throughput.
+
+    Processing time for a segment of duration D is modelled per node as
+    a + b*D, fitted over a bounded history of completed segments
+    observed through proc_status transitions. Since the automator waits
+    for all nodes to finish, the slowest node sets the cycle time:
+
+        T(D) = overhead + D + max_n(a_n + b_n*D)
+
+    Longer segments amortise fixed overheads, but the sky usable per
+    phase centre (targets recorded for a full transit, see
+    `usable_footprint`) saturates at a sweep of two beamwidths. If the
+    remaining track time R is not known, the usable footprint per cycle,
+    F(D)/T(D), is maximised; with a linear processing model this has an
+    interior optimum unless overheads are small. With a known R, the
+    total footprint of the segments that finish recording before the
+    track ends is maximised instead.
+
+    Only the duration is chosen. The spacing between segments follows
+    from processing time (the next segment starts once all nodes are
+    idle) and cannot be controlled; it is returned for reporting only.
+    """
+
+    def __init__(self, default_duration=SEGMENT_DEFAULT,
+        min_duration=SEGMENT_MIN, max_duration=SEGMENT_MAX,
+        overhead=SEGMENT_OVERHEAD, history_len=HISTORY_LEN,
+        slew_rate=SLEW_RATE):
+        self.default_duration = default_duration
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.overhead = overhead
+        self.history_len = history_len
+        self.slew_rate = slew_rate
+        # Per node: deque of (segment duration, processing duration)
+        self.history = {}
+        # Per node: (processing start time, segment duration)
+        self.in_progress = {}
+        self.last_duration = None
+
+    def segment_recorded(self, duration):
+        """Note the duration of the segment just commanded.
+        """
+        self.last_duration = duration
+
+    def update(self, transitions, now):
+        """Update the model from processing status transitions.
+
+        Args:
+            transitions (list): (instance, old status, new status), as
+            returned by `node_transitions`.
+            now (float): Time of the update (Unix seconds).
+        """
+        for instance, old, status in transitions:
+            if status == 'processing':
+                if self.last_duration is not None:
+                    self.in_progress[instance] = (now, self.last_duration)
+            elif old == 'processing' and instance in self.in_progress:
+                t_start, duration = self.in_progress.pop(instance)
+                # Only learn from segments processed successfully:
+                if status == 'idling':
+                    self.history.setdefault(
+                        instance, deque(maxlen=self.history_len)
+                    ).append((duration, now - t_start))
+
+    def node_model(self, instance):
+        """Least-squares fit of processing time a + b*D for one node.
+
+        Returns:
+            a (float): Fixed processing time per segment (seconds).
+            b (float): Processing seconds per recorded second.
+        """
+        samples = self.history[instance]
+        n = len(samples)
+        mean_d = sum(d for d, _ in samples)/n
+        mean_p = sum(p for _, p in samples)/n
+        var_d = sum((d - mean_d)**2 for d, _ in samples)
+        if var_d == 0:
+            # All segments of the same duration; rate only:
+            return 0.0, max(mean_p/mean_d, 0.0)
+        b = sum((d - mean_d)*(p - mean_p) for d, p in samples)/var_d
+        b = max(b, 0.0)
+        a = max(mean_p - b*mean_d, 0.0)
+        return a, b
+
+    def cycle_time(self, duration, models):
+        """Expected time from commanding one segment to the next.
+        """
+        processing = max(
+            [a + b*duration for a, b in models],
+            default=0.0
+        )
+        return self.overhead + duration + processing
+
+    def n_segments(self, duration, cycle, remaining):
+        """Expected number of segments that finish recording in the
+        remaining track time.
+        """
+        if remaining < self.overhead + duration:
+            return 0
+        return math.floor((remaining - self.overhead - duration)/cycle) + 1
+
+    def plan(self, remaining=None, fcent=VLASS_FCENT):
+        """Choose the next segment duration.
+
+        Args:
+            remaining (float): Remaining track time in seconds, if known.
+            fcent (float): Centre frequency in Hz, which sets the primary
+            beam size.
+
+        Returns:
+            duration (float): Segment duration in seconds.
+            spacing (float): Expected time between segment starts (not
+            controlled; for reporting).
+        """
+        radius = fov_radius(fcent)
+        # No use in sweeping further than two beamwidths:
+        max_duration = min(self.max_duration, 4*radius/self.slew_rate)
+        models = [self.node_model(i) for i in self.history if self.history[i]]
+        if not models:
+            duration = min(self.default_duration, max_duration)
+            return duration, self.cycle_time(duration, models)
+        candidates = []
+        duration = self.min_duration
+        while duration < max_duration:
+            candidates.append(duration)
+            duration += SEGMENT_STEP
+        candidates.append(max_duration)
+        best = None
+        for duration in candidates:
+            cycle = self.cycle_time(duration, models)
+            footprint = usable_footprint(self.slew_rate*duration, radius)
+            if remaining is None:
+                score = footprint/cycle
+            else:
+                score = self.n_segments(duration, cycle, remaining)*footprint
+            if best is None or score > best[0]:
+                best = (score, duration, cycle)
+        _, duration, cycle = best
+        log.debug('Segment plan: {} s every {:.1f} s'.format(duration, cycle))
+        return duration, cycle
+
+def simulate(r, planner, track_length, nodes, fcent=VLASS_FCENT, fixed=None,
+    seed=0):
+    """Simulate segmenting a single VLASS track in virtual time.
+
+    Simulated nodes publish their processing status to `SIM_HASH` in
+    Redis, from which the planner learns as the automator would.
+
+    Args:
+        r (obj): Redis connection.
+        planner (obj): `SegmentPlanner` instance.
+        track_length (float): Track duration in seconds.
+        nodes (dict): Per instance, (a, b, jitter) of the true processing
+        time a + b*D, with fractional Gaussian jitter.
+        fcent (float): Centre frequency in Hz.
+        fixed (float): Use this fixed segment duration instead of
+        planning.
+        seed (int): Random seed.
+
+    Returns:
+        coverage (float): Fraction of the track recorded.
+        usable (float): Fraction of the scanned strip (one beamwidth
+        wide) within which targets were recorded for a full transit.
+        idle (float): Mean fraction of time nodes were not processing.
+    """
+    rng = random.Random(seed)
+    r.delete(SIM_HASH)
+    node_states = {}
+
+    def publish(instance, status, now):
+        r.hset(SIM_HASH, instance, json.dumps(status))
+        status_lists = {}
+        for node, val in r.hgetall(SIM_HASH).items():
+            status_lists.setdefault(json.loads(val), []).append(node)
+        planner.update(node_transitions(node_states, status_lists), now)
+
+    for instance in nodes:
+        publish(instance, 'idling', 0.0)
+    t = 0.0
+    covered = 0.0
+    usable = 0.0
+    busy = 0.0
+    radius = fov_radius(fcent)
+    while True:
+        if fixed is None:
+            duration, _ = planner.plan(track_length - t, fcent)
+        else:
+            duration = fixed
+        rec_end = t + planner.overhead + duration
+        if rec_end > track_length:
+            break
+        planner.segment_recorded(duration)
+        covered += duration
+        usable += usable_footprint(planner.slew_rate*duration, radius)
+        finished = []
+        for instance, (a, b, jitter) in nodes.items():
+            publish(instance, 'processing', rec_end)
+            proc = max((a + b*duration)*rng.gauss(1, jitter), 0.0)
+            busy += min(proc, track_length - rec_end)
+            finished.append((rec_end + proc, instance))
+        for t_done, instance in sorted(finished):
+            publish(instance, 'idling', t_done)
+        t = max(t_done for t_done, _ in finished)
+    r.delete(SIM_HASH)
+    idle = 1 - busy/(len(nodes)*track_length)
+    strip = 2*radius*planner.slew_rate*track_length
+    return covered/track_length, usable/strip, idle
+
+def cli():
+    """CLI for comparing fixed and adaptive segmenting in simulation.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Simulate fixed vs. adaptive VLASS segmenting.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--redis_endpoint",
+        type=str,
+        default="127.0.0.1:6379",
+        help="Local Redis endpoint.",
+    )
+    parser.add_argument(
+        "--track_length",
+        type=float,
+        default=600.0,
+        help="Simulated track duration in seconds.",
+    )
+    parser.add_argument(
+        "--nodes",
+        type=int,
+        default=8,
+        help="Number of simulated processing nodes.",
+    )
+    parser.add_argument(
+        "--proc_fixed",
+        type=float,
+        default=15.0,
+        help="Mean fixed processing time per segment (seconds).",
+    )
+    parser.add_argument(
+        "--proc_rate",
+        type=float,
+        default=2.0,
+        help="Mean processing seconds per recorded second.",
+    )
+    parser.add_argument(
+        "--fcent",
+        type=float,
+        default=VLASS_FCENT,
+        help="Centre frequency in Hz.",
+    )
+    parser.add_argument(
+        "--fixed_duration",
+        type=float,
+        default=SEGMENT_DEFAULT,
+        help="Segment duration for the fixed strategy.",
+    )
+    parser.add_argument(
+        "--tracks",
+        type=int,
+        default=5,
+        help="Number of tracks to simulate (the adaptive model persists).",
+    )
+    args = parser.parse_args()
+
+    redis_host, redis_port = args.redis_endpoint.split(':')
+    r = redis.StrictRedis(
+        host=redis_host,
+        port=redis_port,
+        decode_responses=True
+    )
+    rng = random.Random(0)
+    nodes = {
+        'sim-gpu-{}/0'.format(i): (
+            args.proc_fixed*rng.uniform(0.8, 1.2),
+            args.proc_rate*rng.uniform(0.8, 1.2),
+            0.05
+        )
+        for i in range(args.nodes)
+    }
+    fixed_planner = SegmentPlanner()
+    adaptive_planner = SegmentPlanner()
+    print('track  strategy  coverage  usable  idle')
+    for track in range(args.tracks):
+        for name, planner, fixed in [
+            ('fixed', fixed_planner, args.fixed_duration),
+            ('adaptive', adaptive_planner, None)
+        ]:
+            coverage, usable, idle = simulate(r, planner, args.track_length,
+                nodes, fcent=args.fcent, fixed=fixed, seed=track)
+            print('{:5d}  {:8s}  {:8.3f}  {:6.3f}  {:.3f}'.format(
+                track, name, coverage, usable, idle))
+
+if __name__ == "__main__":
+    cli()